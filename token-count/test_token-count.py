@@ -5,7 +5,10 @@ import unittest
 from unittest.mock import patch, mock_open, MagicMock
 
 # Import the functions from your main script
-from token_count import get_encoders, get_encoder_by_model, count_tokens, process_input, main, EncodingNotFoundError
+from token_count import _bench_one, _chunk_text, _get_batch_encoder, _get_encoding, _iter_file_chunks, get_encoders, \
+    get_encoder_by_model, count_tokens, count_tokens_batch, count_tokens_parallel, count_tokens_stream, process_input, \
+    benchmark_encoders, main, EncodingNotFoundError
+from tokens_approx import count_tokens_approx
 
 
 class TestTokenCounter(unittest.TestCase):
@@ -40,16 +43,132 @@ class TestTokenCounter(unittest.TestCase):
         self.assertIsInstance(token_count, int)
         self.assertGreater(token_count, 0)
 
+    def test_chunk_text(self):
+        chunks = list(_chunk_text(self.lorem_ipsum, target=1000))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(''.join(chunks), self.lorem_ipsum)
+        for chunk in chunks[:-1]:
+            self.assertGreaterEqual(len(chunk), 1000)
+
+    def test_chunk_text_preserves_token_count(self):
+        text = "ab\n\ncd\n  \nef.\ngh\r\nij 12\n34\u00a0\nkl,\n\n's\n" * 50 + self.lorem_ipsum
+        self.assertGreater(len(list(_chunk_text(text, target=7))), 1)
+        for encoder in get_encoders():
+            with self.subTest(encoder=encoder):
+                enc = _get_encoding(encoder)
+                chunked = sum(len(enc.encode_ordinary(chunk)) for chunk in _chunk_text(text, target=7))
+                self.assertEqual(chunked, len(enc.encode_ordinary(text)))
+
+    def test_iter_file_chunks(self):
+        chunks = list(_iter_file_chunks('test_lorem-big.txt', target=1000))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(chunks, list(_chunk_text(self.lorem_ipsum, target=1000)))
+
+    def test_iter_file_chunks_without_boundaries(self):
+        text = '{"a":[1,2,3]}' * 1000
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as temp_file:
+            temp_file.write(text)
+            temp_filename = temp_file.name
+        try:
+            self.assertEqual(list(_iter_file_chunks(temp_filename, target=100)), [text])
+        finally:
+            os.unlink(temp_filename)
+
+    def test_count_tokens_stream(self):
+        files = ['test_lorem.txt', 'test_lorem-big.txt']
+        enc = _get_encoding('cl100k_base')
+        expected = sum(len(enc.encode_ordinary(text)) for text in process_input(files))
+        with patch('token_count.CHUNK_SIZE', 1000):
+            self.assertGreater(len(list(_iter_file_chunks('test_lorem-big.txt'))), 1)
+            self.assertEqual(count_tokens_stream(files), expected)
+
+    def test_count_tokens_parallel(self):
+        files = ['test_lorem.txt', 'test_lorem-big.txt']
+        self.assertEqual(count_tokens_parallel(files), count_tokens_batch(process_input(files)))
+
+    def test_count_tokens_parallel_negative(self):
+        result = count_tokens_parallel(['test_lorem.txt'], encoder="nonexistent_encoder")
+        self.assertIsNone(result)
+
     def test_count_tokens_negative(self):
         with patch('tiktoken.get_encoding', side_effect=KeyError):
             result = count_tokens("Test", encoder="nonexistent_encoder")
         self.assertIsNone(result)
 
+    def test_count_tokens_special_token_text(self):
+        token_count = count_tokens("Hello <|endoftext|> world")
+        self.assertIsInstance(token_count, int)
+        self.assertGreater(token_count, 3)
+
+    def test_get_batch_encoder_fallback(self):
+        enc = MagicMock(spec=['encode_ordinary'])
+        enc.encode_ordinary.side_effect = list
+        _get_batch_encoder.cache_clear()
+        with patch('token_count._get_encoding', return_value=enc):
+            encode_batch = _get_batch_encoder('fake_base')
+        _get_batch_encoder.cache_clear()
+        self.assertEqual(encode_batch(['ab', 'c'], num_threads=2), [['a', 'b'], ['c']])
+
+    def test_count_tokens_batch(self):
+        texts = ["Hello, world!", "Goodbye, world!"]
+        token_count = count_tokens_batch(texts)
+        self.assertEqual(token_count, sum(count_tokens(text) for text in texts))
+
+    def test_count_tokens_batch_negative(self):
+        result = count_tokens_batch(["Test"], encoder="nonexistent_encoder")
+        self.assertIsNone(result)
+
+    def test_count_tokens_unknown_encoder(self):
+        result = count_tokens("Test", encoder="nonexistent_encoder")
+        self.assertIsNone(result)
+
+    def test_count_tokens_stream_negative(self):
+        result = count_tokens_stream(['test_lorem.txt'], encoder="nonexistent_encoder")
+        self.assertIsNone(result)
+
+    def test_count_tokens_approx_empty(self):
+        self.assertEqual(count_tokens_approx(""), 0)
+
+    def test_count_tokens_approx_monotonic(self):
+        previous = 0
+        for end in range(0, len(self.lorem_ipsum), 97):
+            token_count = count_tokens_approx(self.lorem_ipsum[:end])
+            self.assertGreaterEqual(token_count, previous)
+            previous = token_count
+
+    def test_count_tokens_approx_held_out(self):
+        # Neither file was used to fit the estimator.
+        for text in process_input(['../README.md', '../LICENSE']):
+            self.assertAlmostEqual(count_tokens_approx(text), count_tokens(text), delta=0.15 * count_tokens(text))
+
     def test_process_input(self):
         test_input = "This is a test.\nSecond line."
-        with patch('fileinput.input', return_value=io.StringIO(test_input)):
+        with patch('sys.stdin', io.TextIOWrapper(io.BytesIO(test_input.encode('utf-8')))):
             result = process_input()
-        self.assertEqual(result, test_input)
+        self.assertEqual(result, [test_input])
+
+    def test_process_input_files(self):
+        result = process_input(['test_lorem.txt', 'test_lorem-big.txt'])
+        self.assertEqual(len(result), 2)
+        self.assertEqual(result[1], self.lorem_ipsum)
+
+    def test_process_input_empty_file(self):
+        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
+            temp_filename = temp_file.name
+        try:
+            self.assertEqual(process_input([temp_filename]), [''])
+        finally:
+            os.unlink(temp_filename)
+
+    @unittest.skipUnless(os.path.isdir('/dev/fd'), "requires /dev/fd")
+    def test_process_input_pipe(self):
+        read_fd, write_fd = os.pipe()
+        os.write(write_fd, b'hello world\n')
+        os.close(write_fd)
+        try:
+            self.assertEqual(process_input([f'/dev/fd/{read_fd}']), ['hello world\n'])
+        finally:
+            os.close(read_fd)
 
     @patch('argparse.ArgumentParser.parse_args')
     @patch('builtins.print')
@@ -149,6 +268,103 @@ class TestTokenCounter(unittest.TestCase):
 
         self.assertEqual(len(log.records), 0)
 
+    def test_bench_one(self):
+        with open('test_lorem.txt') as f:
+            text = f.read()
+
+        encoder, token_count, duration = _bench_one('cl100k_base', text)
+
+        self.assertEqual(encoder, 'cl100k_base')
+        self.assertEqual(token_count, count_tokens(text))
+        self.assertGreaterEqual(duration, 0)
+
+    @patch('token_count.get_encoders', return_value=['cl100k_base'])
+    def test_benchmark_encoders(self, mock_get_encoders):
+        with open('test_lorem.txt') as f:
+            text = f.read()
+
+        result = benchmark_encoders(text)
+
+        self.assertEqual(list(result), ['cl100k_base'])
+        self.assertEqual(result['cl100k_base']['encoder'], 'cl100k_base')
+        self.assertEqual(result['cl100k_base']['count'], count_tokens(text))
+        self.assertGreaterEqual(result['cl100k_base']['duration'], 0)
+
+    @staticmethod
+    def _main_args(**kwargs):
+        """Build arguments for main() with every option set explicitly, overridden by ``kwargs``."""
+        args = dict(
+            text=['test_lorem.txt', 'test_lorem-big.txt'], list=False, benchmark=False, model=None,
+            encoder='cl100k_base', approx=False, parallel_files=False, output=None, verbose=False, quiet=False
+        )
+        args.update(kwargs)
+        return MagicMock(**args)
+
+    @patch('builtins.print')
+    def test_main_stream_mode(self, mock_print):
+        args = self._main_args()
+
+        with patch('token_count.STREAM_THRESHOLD', 0), \
+                patch('token_count.count_tokens_stream', wraps=count_tokens_stream) as mock_stream:
+            main(args)
+
+        mock_stream.assert_called_once_with(args.text, encoder='cl100k_base')
+        mock_print.assert_called_once_with(f"Token count: {count_tokens_batch(process_input(args.text))}")
+
+    @patch('builtins.print')
+    def test_main_approx_mode(self, mock_print):
+        args = self._main_args(approx=True)
+
+        with patch('token_count.count_tokens_batch') as mock_batch:
+            main(args)
+
+        mock_batch.assert_not_called()
+        expected = sum(count_tokens_approx(text) for text in process_input(args.text))
+        mock_print.assert_called_once_with(f"Token count: {expected}")
+
+    def test_main_approx_rejects_other_encoder(self):
+        args = self._main_args(encoder='r50k_base', approx=True)
+
+        with self.assertRaises(SystemExit) as cm:
+            with self.assertLogs(level='ERROR') as log:
+                main(args)
+
+        self.assertEqual(cm.exception.code, 1)
+        self.assertTrue(any("--approx only estimates cl100k_base" in message for message in log.output))
+
+    @patch('builtins.print')
+    def test_main_approx_verbose_labels_estimate(self, mock_print):
+        main(self._main_args(approx=True, verbose=True))
+
+        self.assertIn("Encoder: cl100k_base (estimate)", mock_print.call_args.args[0])
+
+    @patch('builtins.print')
+    def test_main_parallel_files_mode(self, mock_print):
+        args = self._main_args(parallel_files=True)
+
+        with patch('token_count.count_tokens_parallel', wraps=count_tokens_parallel) as mock_parallel:
+            main(args)
+
+        mock_parallel.assert_called_once_with(args.text, encoder='cl100k_base')
+        mock_print.assert_called_once_with(f"Token count: {count_tokens_batch(process_input(args.text))}")
+
+    def test_main_parallel_files_invalid_encoder(self):
+        args = self._main_args(text=['test_lorem.txt'], encoder='invalid_encoder', parallel_files=True)
+
+        with self.assertRaises(SystemExit) as cm:
+            with self.assertLogs(level='ERROR') as log:
+                main(args)
+
+        self.assertEqual(cm.exception.code, 1)
+        self.assertTrue(any("Error creating encoder" in message for message in log.output))
+
+    def test_main_verbose_input_size(self):
+        expected = sum(os.path.getsize(file) for file in self._main_args().text)
+        for parallel_files in (False, True):
+            with self.subTest(parallel_files=parallel_files), patch('builtins.print') as mock_print:
+                main(self._main_args(parallel_files=parallel_files, verbose=True))
+                self.assertIn(f"Input size: {expected} bytes", mock_print.call_args.args[0])
+
     def test_main_with_nonexistent_file(self):
         with patch('sys.argv', ['token_counter.py', '-t', 'nonexistent.txt']):
             with self.assertRaises(SystemExit):
@@ -1,21 +1,88 @@
 import argparse
-import datetime
-import fileinput
+import codecs
+import functools
 import logging
+import mmap
+import os
+import re
+import stat
 import sys
-from typing import Optional
+import time
+from operator import itemgetter
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, Optional
 
-import tiktoken
+from tokens_approx import count_tokens_approx
+
+if TYPE_CHECKING:
+    import tiktoken
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Texts longer than this are split at safe boundaries and encoded as a batch.
+CHUNK_SIZE = 1 << 20
+
+# Safe places to split text: after a lone line break between two non-whitespace characters, or right
+# before whitespace that follows a letter or digit. No encoder's pre-tokenizer joins text across either
+# point, so splitting there leaves the token count unchanged. Each alternative starts with the whitespace
+# character so the search scans quickly; _split_point turns a match into the split index.
+_SAFE_SPLIT = re.compile(r'(?P<after>\n)(?<=\S\n)(?=\S)|\s(?<=[^\W_]\s)')
+
+# File inputs larger than this in total are streamed in chunks instead of being read into memory.
+STREAM_THRESHOLD = 64 << 20
+
+# Number of characters encoded once before timing each encoder in a benchmark.
+BENCHMARK_WARMUP_SIZE = 4096
+
 
 def get_encoders() -> list[str]:
     """Return a list of available encoders."""
+    import tiktoken
     return tiktoken.list_encoding_names()
 
 
+@functools.lru_cache(maxsize=None)
+def _get_encoding(name: str) -> "tiktoken.Encoding":
+    """Return the tiktoken encoding for ``name``, constructed once per name."""
+    import tiktoken
+    return tiktoken.get_encoding(name)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_batch_encoder(name: str) -> Callable[..., list[list[int]]]:
+    """
+    Return the fastest available batch encoder for the tiktoken encoding ``name``.
+
+    Prefers ``encode_ordinary_batch``, falling back to encoding each text with ``encode_ordinary``
+    on tiktoken versions that do not provide it.
+
+    :param name: The encoder name to look up.
+    :return: Callable taking a list of texts and a ``num_threads`` keyword, returning one token list per text.
+    """
+    enc = _get_encoding(name)
+    encode_batch = getattr(enc, "encode_ordinary_batch", None)
+    if encode_batch is None:
+        def encode_batch(texts: list[str], num_threads: Optional[int] = None) -> list[list[int]]:
+            return [enc.encode_ordinary(text) for text in texts]
+    return encode_batch
+
+
+def _load_encoding(encoder: str) -> Optional["tiktoken.Encoding"]:
+    """Return the tiktoken encoding for ``encoder``, or log an error and return None if it cannot be created."""
+    try:
+        return _get_encoding(encoder)
+    except (KeyError, ValueError) as e:
+        logger.error(f"Error creating encoder '{encoder}': {e}")
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding_for_model(model: str) -> "tiktoken.Encoding":
+    """Return the tiktoken encoding for ``model``, constructed once per model."""
+    import tiktoken
+    return tiktoken.encoding_for_model(model)
+
+
 class EncodingNotFoundError(Exception):
     """Custom exception for when an encoding is not found."""
     pass
@@ -30,7 +97,7 @@ def get_encoder_by_model(model: str) -> str:
     :raises EncodingNotFoundError: If the encoder for the model is not found.
     """
     try:
-        ret = tiktoken.encoding_for_model(model).name
+        ret = _encoding_for_model(model).name
     except KeyError as e:
         raise EncodingNotFoundError(f"Model to encoder name lookup failed for {model}: {e}")
 
@@ -39,6 +106,35 @@ def get_encoder_by_model(model: str) -> str:
     return ret
 
 
+def _split_point(match: re.Match) -> int:
+    """Return the index at which to split for a match of ``_SAFE_SPLIT``."""
+    return match.end() if match.lastgroup == 'after' else match.start()
+
+
+def _chunk_text(text: str, target: Optional[int] = None) -> Iterator[str]:
+    """
+    Split text into chunks of at least ``target`` characters, cutting only at safe boundaries.
+
+    Cuts are only made where no encoder's pre-tokenizer merges across (see ``_SAFE_SPLIT``), so
+    counting the chunks separately gives the same total as counting the whole text. Text without
+    such a boundary is returned as a single chunk.
+
+    :param text: Text to split.
+    :param target: Minimum size of each chunk except the last (default: CHUNK_SIZE).
+    :return: Iterator over consecutive slices of ``text``.
+    """
+    target = target or CHUNK_SIZE
+    start = 0
+    while start < len(text):
+        match = _SAFE_SPLIT.search(text, start + target)
+        if match is None:
+            yield text[start:]
+            return
+        end = _split_point(match)
+        yield text[start:end]
+        start = end
+
+
 def count_tokens(text: str, encoder: str = 'cl100k_base') -> Optional[int]:
     """
     Count tokens in a given text.
@@ -48,61 +144,241 @@ def count_tokens(text: str, encoder: str = 'cl100k_base') -> Optional[int]:
     :param encoder: Encoder to use for tokenization (default: cl100k_base).
     :return: Number of tokens in the text, or None if an error occurs.
     """
-    logger.debug(f"Counting tokens with encoder: {encoder}")
+    logger.debug("Counting tokens with encoder: %s", encoder)
+    enc = _load_encoding(encoder)
+    if enc is None:
+        return None
+    encode_batch = _get_batch_encoder(encoder)
+
     try:
-        enc = tiktoken.get_encoding(encoder)
-    except KeyError as e:
-        logger.error(f"Error creating encoder '{encoder}': {e}")
+        if len(text) > CHUNK_SIZE:
+            batches = encode_batch(list(_chunk_text(text)), num_threads=os.cpu_count())
+            return sum(map(len, batches))
+        return len(enc.encode_ordinary(text))
+    except Exception as e:
+        logger.error(f"Error counting tokens: {e}")
         return None
 
+
+def count_tokens_batch(texts: list[str], encoder: str = 'cl100k_base') -> Optional[int]:
+    """
+    Count tokens across several independent texts using tiktoken's threaded batch encoder.
+
+    :param texts: Texts to count tokens from, e.g. one per input file.
+    :param encoder: Encoder to use for tokenization (default: cl100k_base).
+    :return: Total number of tokens in all texts, or None if an error occurs.
+    """
+    logger.debug("Counting tokens in %d texts with encoder: %s", len(texts), encoder)
+    if _load_encoding(encoder) is None:
+        return None
+    encode_batch = _get_batch_encoder(encoder)
+
     try:
-        tokens = enc.encode(text)
-        return len(tokens)
+        chunks = [chunk for text in texts for chunk in _chunk_text(text)]
+        batches = encode_batch(chunks, num_threads=os.cpu_count())
+        return sum(len(tokens) for tokens in batches)
     except Exception as e:
         logger.error(f"Error counting tokens: {e}")
         return None
 
 
-def process_input(files: Optional[list[str]] = None) -> str:
+def _iter_file_chunks(path: str, target: Optional[int] = None) -> Iterator[str]:
     """
-    Process input files or stdin and return the combined text.
+    Read a file incrementally and yield the same chunks ``_chunk_text`` would produce for its contents.
+
+    Only the chunk being assembled is held in memory; text that has already been searched for a cut
+    is kept in a list, so a file without safe boundaries is not copied repeatedly.
+
+    :param path: Path of the file to read.
+    :param target: Minimum size of each chunk except the last (default: CHUNK_SIZE).
+    :return: Iterator over the decoded chunks of the file, in order.
+    """
+    target = target or CHUNK_SIZE
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    # ``parts`` holds the searched start of the current chunk, ``text`` the rest. The last two searched
+    # characters stay in ``text`` so the split pattern can look behind and ahead of every position.
+    parts, scanned, text = [], 0, ''
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(target)
+            text += decoder.decode(data, final=not data)
+            # A match on the last character is deferred until the next one is known.
+            while (match := _SAFE_SPLIT.search(text, max(target - scanned, 1))) \
+                    and (not data or match.start() < len(text) - 1):
+                end = _split_point(match)
+                parts.append(text[:end])
+                yield ''.join(parts)
+                parts, scanned, text = [], 0, text[end:]
+            if not data:
+                break
+            if len(text) > 2:
+                parts.append(text[:-2])
+                scanned += len(text) - 2
+                text = text[-2:]
+    parts.append(text)
+    if chunk := ''.join(parts):
+        yield chunk
+
+
+def count_tokens_stream(paths: list[str], encoder: str = 'cl100k_base') -> Optional[int]:
+    """
+    Count tokens in files without reading them into memory at once.
+
+    Chunks are encoded in small batches so peak memory stays proportional to the chunk size.
+
+    :param paths: Paths of the files to count tokens from.
+    :param encoder: Encoder to use for tokenization (default: cl100k_base).
+    :return: Total number of tokens in all files, or None if an error occurs.
+    """
+    logger.debug("Streaming tokens from %d files with encoder: %s", len(paths), encoder)
+    if _load_encoding(encoder) is None:
+        return None
+    encode_batch = _get_batch_encoder(encoder)
+
+    num_threads = os.cpu_count() or 1
+    token_count = 0
+    window = []
+    try:
+        for path in paths:
+            for chunk in _iter_file_chunks(path):
+                window.append(chunk)
+                if len(window) == num_threads:
+                    token_count += sum(map(len, encode_batch(window, num_threads=num_threads)))
+                    window = []
+        if window:
+            token_count += sum(map(len, encode_batch(window, num_threads=num_threads)))
+        return token_count
+    except Exception as e:
+        logger.error(f"Error counting tokens: {e}")
+        return None
+
+
+def _iter_texts(files: Iterable[str]) -> Iterator[str]:
+    """
+    Yield the decoded text of each input, memory-mapping files so they are decoded without an extra copy.
+
+    :param files: File paths to read, where '-' reads from stdin.
+    :return: Iterator over the text of each input, in order.
+    """
+    for file in files:
+        if file == '-':
+            yield sys.stdin.buffer.read().decode('utf-8')
+            continue
+        with open(file, 'rb') as f:
+            st = os.fstat(f.fileno())
+            # Pipes, devices and empty files cannot be mapped; read them instead.
+            if not stat.S_ISREG(st.st_mode) or st.st_size == 0:
+                yield f.read().decode('utf-8')
+                continue
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                yield str(mm, 'utf-8')
+
+
+def process_input(files: Optional[list[str]] = None) -> list[str]:
+    """
+    Process input files or stdin and return the text of each input.
 
     :param files: List of file paths to process. If None, reads from stdin.
-    :return: Combined text from all inputs.
+    :return: List with the text of each input, in order.
+    """
+    return list(_iter_texts(files if files else ('-',)))
+
+
+def _count_file(path: str, encoder: str) -> Optional[int]:
+    """Count the tokens in the file at ``path`` with ``encoder``."""
+    return count_tokens(next(_iter_texts((path,))), encoder)
+
+
+def count_tokens_parallel(paths: list[str], encoder: str = 'cl100k_base') -> Optional[int]:
+    """
+    Count tokens in many files using a pool of worker processes, each with its own cached encoder.
+
+    :param paths: Paths of the files to count tokens from.
+    :param encoder: Encoder to use for tokenization (default: cl100k_base).
+    :return: Total number of tokens in all files, or None if an error occurs.
+    """
+    import multiprocessing
+
+    logger.debug("Counting tokens in %d files in parallel with encoder: %s", len(paths), encoder)
+    if _load_encoding(encoder) is None:
+        return None
+
+    with multiprocessing.Pool(os.cpu_count()) as pool:
+        counts = pool.map(functools.partial(_count_file, encoder=encoder), paths)
+    if None in counts:
+        return None
+    return sum(counts)
+
+
+def _prefetch_encoding(encoder: str) -> None:
+    """Load ``encoder`` so that its vocabulary is downloaded and cached on disk before it is benchmarked."""
+    try:
+        _get_encoding(encoder)
+    except (KeyError, ValueError):
+        # Reported by count_tokens when the encoder is benchmarked.
+        pass
+
+
+def _bench_one(encoder: str, text: str) -> tuple[str, Optional[int], float]:
     """
-    input_text = ''
-    for line in fileinput.input(files=files if files else ('-',)):
-        input_text += line
-    return input_text
+    Count the tokens in ``text`` with ``encoder``, returning the count and the seconds taken.
+
+    The encoder is loaded and exercised on a short prefix first, so the timing reflects steady-state encoding.
+    """
+    count_tokens(text[:BENCHMARK_WARMUP_SIZE], encoder)
+    t = time.perf_counter_ns()
+    token_count = count_tokens(text, encoder)
+    duration = (time.perf_counter_ns() - t) / 1e9
+    return encoder, token_count, duration
 
 
 def benchmark_encoders(text: str):
+    from concurrent.futures import ProcessPoolExecutor, wait
+
     ret = {}
     encoders = get_encoders()
     logger.info(f"Benchmarking {len(encoders)} token encoders")
+    # Download and cache the vocabularies in parallel, but time the encoders one at a time in this process:
+    # count_tokens already uses every core, so concurrent timings would mostly measure contention.
+    with ProcessPoolExecutor(max_workers=min(len(encoders), os.cpu_count() or 1)) as executor:
+        wait([executor.submit(_prefetch_encoding, encoder) for encoder in encoders])
     for encoder in encoders:
-        logger.info(f"Benchmarking encoder {encoder}")
-        t = datetime.datetime.now()
-        token_count = count_tokens(text, encoder)
-        duration = datetime.datetime.now() - t
+        encoder, token_count, duration = _bench_one(encoder, text)
+        logger.info(f"Benchmarked encoder {encoder}")
         ret[encoder] = {"encoder": encoder, "count": token_count, "duration": duration}
     return ret
 
 
+def _input_file_size(files: Optional[list[str]]) -> Optional[int]:
+    """
+    Return the total size in bytes of the input files, or None if any input is stdin or not a regular file.
+
+    :param files: List of input file paths, or None for stdin.
+    :return: Total size of the files in bytes, or None if it cannot be known without reading them.
+    """
+    if not files or '-' in files:
+        return None
+    size = 0
+    for file in files:
+        st = os.stat(file)
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        size += st.st_size
+    return size
+
+
 def main(args: argparse.Namespace) -> None:
     if args.list:
         print(f"Available encoders: {', '.join(get_encoders()).strip()}")
         sys.exit(0)
 
     if args.benchmark:
-        benchmark = benchmark_encoders(process_input(args.text))
-        sorted_benchmark = sorted(benchmark.items(), key=lambda x: x[1]["duration"], reverse=False)
-        i = 1
-        for encoder in sorted_benchmark:
-            print(f"Encoder: {encoder[0]} - Rank: {i}/{len(sorted_benchmark)}")
-            print(f"Token Count: {encoder[1]['count']}")
-            print(f"Duration: {encoder[1]['duration'].total_seconds()}\n")
-            i += 1
+        benchmark = benchmark_encoders(''.join(process_input(args.text)))
+        sorted_benchmark = sorted(benchmark.values(), key=itemgetter("duration"))
+        for i, result in enumerate(sorted_benchmark, start=1):
+            print(f"Encoder: {result['encoder']} - Rank: {i}/{len(sorted_benchmark)}")
+            print(f"Token Count: {result['count']}")
+            print(f"Duration: {result['duration']}\n")
 
         sys.exit(0)
 
@@ -114,45 +390,54 @@ def main(args: argparse.Namespace) -> None:
             logger.error(str(e))
             sys.exit(1)
 
-    input_text = process_input(args.text)
-    logger.debug(f"Input size: {len(input_text)} characters")
+    if args.approx and args.encoder != 'cl100k_base':
+        logger.error(f"--approx only estimates cl100k_base token counts, not '{args.encoder}'")
+        sys.exit(1)
 
-    start_time = datetime.datetime.now()
-    token_count = count_tokens(input_text, encoder=args.encoder)
-    duration = datetime.datetime.now() - start_time
+    input_size = _input_file_size(args.text)
+    stream = not args.approx and input_size is not None and input_size > STREAM_THRESHOLD
+    parallel = not args.approx and not stream and input_size is not None and args.parallel_files
+    if not (stream or parallel):
+        texts = process_input(args.text)
+        if input_size is None:
+            input_size = sum(len(text.encode('utf-8')) for text in texts)
+    logger.debug("Input size: %d bytes", input_size)
+
+    start_time = time.perf_counter_ns()
+    if stream:
+        token_count = count_tokens_stream(args.text, encoder=args.encoder)
+    elif parallel:
+        token_count = count_tokens_parallel(args.text, encoder=args.encoder)
+    elif args.approx:
+        token_count = sum(count_tokens_approx(text) for text in texts)
+    else:
+        token_count = count_tokens_batch(texts, encoder=args.encoder)
+    duration = (time.perf_counter_ns() - start_time) / 1e9
 
     if token_count is None:
         logger.error("Failed to count tokens")
         sys.exit(1)
 
-    logger.debug(f"Token count: {token_count}")
-    logger.debug(f"Processing time: {duration.total_seconds():.4f} seconds")
+    logger.debug("Token count: %d", token_count)
+    logger.debug("Processing time: %.4f seconds", duration)
 
-    verbose_output = f"Encoder: {args.encoder}\nInput size: {len(input_text)} characters\nProcessing time: {duration.total_seconds():.4f} seconds\nToken count: {token_count}"
-    standard_output = f"Token count: {token_count}"
+    if args.verbose:
+        encoder = f"{args.encoder} (estimate)" if args.approx else args.encoder
+        output = f"Encoder: {encoder}\nInput size: {input_size} bytes\nProcessing time: {duration:.4f} seconds\nToken count: {token_count}"
+    elif args.quiet:
+        output = str(token_count)
+    else:
+        output = f"Token count: {token_count}"
 
     if args.output:
         with open(args.output, 'w') as f:
-            if args.verbose:
-                f.write(verbose_output)
-            elif args.quiet:
-                f.write(str(token_count))
-            else:
-                f.write(standard_output)
+            f.write(output)
 
         logger.info(f"Results written to {args.output}")
 
+    print(output)
+
     if args.quiet and not args.verbose:
-        print(token_count)
-
-    if not args.quiet and not args.verbose:
-        print(standard_output)
-    elif args.verbose:
-        print(f"Encoder: {args.encoder}")
-        print(f"Input size: {len(input_text)} characters")
-        print(f"Processing time: {duration.total_seconds():.4f} seconds")
-        print(f"Token count: {token_count}")
-    elif args.quiet:
         # Communicate the token count through the system exit code ;)
         sys.exit(token_count)
 
@@ -169,6 +454,10 @@ if __name__ == "__main__":
                             default=False)
     parser.add_argument("-m", "--model", help="Specify an encoder based on the OpenAI model name")
     parser.add_argument("-e", "--encoder", default='cl100k_base', help="Token encoder to use")
+    parser.add_argument("-a", "--approx", action='store_true',
+                        help="Estimate the cl100k_base token count without running the encoder", default=False)
+    parser.add_argument("-p", "--parallel-files", action='store_true',
+                        help="Count each input file in a separate worker process", default=False)
     parser.add_argument("-o", "--output", help="Output file to write results")
     verbosity_group = parser.add_mutually_exclusive_group()
     verbosity_group.add_argument("-v", "--verbose", action='store_true', help="Increase output verbosity")
@@ -0,0 +1,28 @@
+import string
+
+_PUNCTUATION = string.punctuation.encode('ascii')
+_DIGITS = string.digits.encode('ascii')
+
+# cl100k_base tokens per whitespace-separated word, ASCII punctuation byte and digit byte, fitted by least
+# squares on a sample of standard library modules and their docstrings. On English prose and source code
+# the estimate is usually within 15% of the exact count; other languages and unusual vocabulary (for
+# example lorem ipsum, about 35% low) are estimated less accurately.
+TOKENS_PER_WORD = 1.09
+TOKENS_PER_PUNCTUATION = 0.94
+TOKENS_PER_DIGIT = 0.6
+
+
+def count_tokens_approx(text: str) -> int:
+    """
+    Estimate the cl100k_base token count of a given text without running the encoder.
+
+    Only counts words, punctuation and digits with byte-level operations, which is much faster than encoding.
+
+    :param text: Text to estimate tokens for.
+    :return: Approximate number of cl100k_base tokens in the text.
+    """
+    data = text.encode('utf-8')
+    words = len(data.split())
+    punctuation = len(data) - len(data.translate(None, _PUNCTUATION))
+    digits = len(data) - len(data.translate(None, _DIGITS))
+    return round(words * TOKENS_PER_WORD + punctuation * TOKENS_PER_PUNCTUATION + digits * TOKENS_PER_DIGIT)